@@ -1,11 +1,138 @@
 import asyncio
+from array import array
+from collections import deque
+import ctypes
+import ctypes.util
 from dataclasses import dataclass
-from enum import IntEnum
+from enum import IntFlag
+import errno
+import itertools
+import os
 import socket
-import random
 import struct
+import sys
 import time
-from typing import Dict, List, Tuple
+from typing import BinaryIO, Deque, Dict, Iterator, List, NamedTuple, Tuple
+
+# the maximum number of packets handed to the kernel in a single sendmmsg call
+SEND_BATCH_SIZE = 64
+# the minimum of the maximum number of bytes that were sent and not acknowledged yet (of all the streams),
+# so the packets in flight fit in the default receive buffer of the peer
+# (the kernel charges each small datagram about twice its size, for the buffer overhead)
+SEND_WINDOW_BYTES = 64 * 1024
+# the requested size of the send and receive buffers of the socket,
+# the kernel caps it at net.core.wmem_max / net.core.rmem_max (see the README)
+SOCKET_BUFFER_SIZE = 8 << 20
+# set the buffer sizes above the system limits (Linux, needs CAP_NET_ADMIN)
+_SO_SNDBUFFORCE = getattr(socket, 'SO_SNDBUFFORCE', 32)
+_SO_RCVBUFFORCE = getattr(socket, 'SO_RCVBUFFORCE', 33)
+# the time (in seconds) to wait for an ACK packet before assuming that the oldest packet in flight was lost
+ACK_TIMEOUT = 0.1
+# the maximum number of packets received from the kernel in a single recvmmsg call
+RECV_BATCH_SIZE = 16
+# the size of each receive buffer, big enough for the largest UDP datagram (a GRO super-packet can be this big)
+RECV_BUFFER_SIZE = 64 * 1024
+# recvmmsg flags: never block, the socket readiness is awaited on the event loop
+_MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0x40)
+
+# precompiled formats of the packet header and the frame header (see _QUICPacket)
+_HDR = struct.Struct('!BIQ')  # 1 byte for flags, 4 bytes for packet number, 8 bytes for payload length
+_FRM = struct.Struct('!IIQ')  # 4 bytes for stream_id, 4 bytes for offset, 8 bytes for data length
+_HDR_SIZE = _HDR.size
+_FRM_SIZE = _FRM.size
+# the frame offset field is 32 bit and holds the byte offset of the frame in its stream
+MAX_STREAM_SIZE = 1 << 32
+# the packet number field of the header (right after the flags byte)
+_PACKET_NUMBER = struct.Struct('!I')
+_PACKET_NUMBER_OFFSET = 1
+# generate the packet numbers, each packet gets the next number
+_next_packet_number = itertools.count(1).__next__
+
+# the packet number field is 32 bit, so the ACK counter wraps around
+_PACKET_NUMBER_MASK = 0xFFFFFFFF
+
+# UDP segmentation offload (Linux), the constants are exposed by the socket module only from Python 3.12
+_SOL_UDP = getattr(socket, 'SOL_UDP', 17)
+_UDP_SEGMENT = getattr(socket, 'UDP_SEGMENT', 103)
+_UDP_GRO = getattr(socket, 'UDP_GRO', 104)
+# path MTU discovery (Linux): don't fragment, so packets bigger than the path MTU fail instead of being fragmented
+_IP_MTU_DISCOVER = getattr(socket, 'IP_MTU_DISCOVER', 10)
+_IP_PMTUDISC_DO = getattr(socket, 'IP_PMTUDISC_DO', 2)
+# the kernel limits of a single GSO send: the number of segments and the size of the whole IPv4 UDP datagram
+_GSO_MAX_SEGMENTS = 64
+_GSO_MAX_BYTES = 65507
+
+# `struct cmsghdr` (cmsg_len, cmsg_level, cmsg_type), the data of the control message follows the aligned header
+_CMSG_HEADER = struct.Struct('@Nii')
+# the data of the UDP_SEGMENT (16 bit) and UDP_GRO (int) control messages
+_GSO_SIZE = struct.Struct('=H')
+_GRO_SIZE = struct.Struct('=i')
+_CMSG_ALIGN = ctypes.sizeof(ctypes.c_size_t)
+# the size of the control buffer of each received message
+_RECV_CONTROL_SIZE = 64
+
+
+def _cmsg_align(length: int) -> int:
+    """
+    CMSG_ALIGN - round the length up to the alignment of the control messages.
+    """
+    return (length + _CMSG_ALIGN - 1) & ~(_CMSG_ALIGN - 1)
+
+
+# the size of a UDP_SEGMENT control message (CMSG_SPACE of a 16-bit segment size)
+_GSO_CONTROL_SIZE = _cmsg_align(_CMSG_HEADER.size) + _cmsg_align(2)
+
+
+class _IOVec(ctypes.Structure):
+    """
+    struct iovec - a single buffer of a scatter/gather I/O call.
+    """
+    _fields_ = [
+        ('iov_base', ctypes.c_void_p),
+        ('iov_len', ctypes.c_size_t),
+    ]
+
+
+class _MsgHdr(ctypes.Structure):
+    """
+    struct msghdr - a single message of the sendmsg/recvmsg family of system calls.
+    """
+    _fields_ = [
+        ('msg_name', ctypes.c_void_p),
+        ('msg_namelen', ctypes.c_uint32),
+        ('msg_iov', ctypes.POINTER(_IOVec)),
+        ('msg_iovlen', ctypes.c_size_t),
+        ('msg_control', ctypes.c_void_p),
+        ('msg_controllen', ctypes.c_size_t),
+        ('msg_flags', ctypes.c_int),
+    ]
+
+
+class _MMsgHdr(ctypes.Structure):
+    """
+    struct mmsghdr - a message of the sendmmsg/recvmmsg system calls.
+    """
+    _fields_ = [
+        ('msg_hdr', _MsgHdr),
+        ('msg_len', ctypes.c_uint),
+    ]
+
+
+# bind sendmmsg and recvmmsg from the libc (Linux only), on other platforms we fall back to sendto and recvfrom
+_libc_sendmmsg = None
+_libc_recvmmsg = None
+if sys.platform.startswith('linux'):
+    try:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        _libc_sendmmsg = _libc.sendmmsg
+        _libc_sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+        _libc_sendmmsg.restype = ctypes.c_int
+        _libc_recvmmsg = _libc.recvmmsg
+        _libc_recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+        _libc_recvmmsg.restype = ctypes.c_int
+    except (OSError, AttributeError):
+        _libc_sendmmsg = None
+        _libc_recvmmsg = None
 
 
 class QUIC:
@@ -16,26 +143,142 @@ class QUIC:
     """
 
     def __init__(self):
-        # Create UDP socket
+        # Create UDP socket, in non-blocking mode so the I/O doesn't stall the event loop
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+        # is the socket connected to the peer (set when the connection is established)
+        self._is_connected = False
+        if sys.platform.startswith('linux'):
+            self._socket.setsockopt(socket.IPPROTO_IP, _IP_MTU_DISCOVER, _IP_PMTUDISC_DO)
+        # bigger socket buffers, so more packets can be in flight between the system calls
+        self._set_buffer_size(socket.SO_SNDBUF, _SO_SNDBUFFORCE, 'net.core.wmem_max')
+        self._set_buffer_size(socket.SO_RCVBUF, _SO_RCVBUFFORCE, 'net.core.rmem_max')
         self._is_closed = False
 
         # for later use (so we can close the connection and open it again in the same instance)
         self._host = None
         self._port = None
 
-        self._stream_id_generator = 0
-        # a buffer to store the received data
-        self._input_streams: Dict[int, bytes] = {}
+        # a buffer to store the received data, the frames of each stream are copied to their offsets in its bytearray
+        self._input_streams: Dict[int, bytearray] = {}
         # a buffer to store the data that needs to be sent
-        self._output_streams: Dict[int, bytes] = {}
+        self._output_streams: Dict[int, bytes | memoryview | BinaryIO] = {}
+
+        # flow control: the numbers of the packets that were sent and not acknowledged yet.
+        # the queue is bounded, so the streams wait for ACK packets when the window is full
+        self._in_flight: asyncio.Queue | None = None
+        # the number of data packets that were acknowledged by the receiver (as reported in the last ACK packet)
+        self._acked_packets = 0
+        # the number of data packets that were received (the receiver reports it in the ACK packets)
+        self._received_packets = 0
+        # the serialized ACK packet, only its packet number field changes between ACKs
+        self._ack_packet = bytearray(_HDR.pack(QUIQ_Flags.ACK_DATA, 0, 0))
 
         # the statistics of the connection
         self.total_connection_statistics: Stream_Statistics = Stream_Statistics(0, 0, 0, 0, 0, 0)
-        # a dictionary to store the statistics of each stream
-        self.stream_statistics: Dict[int, Stream_Statistics] = {}
-
-    def listen(self, host: str, port: int):
+        # the statistics of each stream, stored as parallel arrays (one per counter) indexed by the stream index
+        self._stream_index: Dict[int, int] = {}
+        self._stream_packets = array('Q')
+        self._stream_frames = array('Q')
+        self._stream_bytes = array('Q')
+        self._stream_payload = array('Q')
+        self._stream_time = array('d')
+
+        # is UDP segmentation offload enabled (set when the connection is established)
+        self._gso = False
+        self._gro = False
+
+        # the message arrays for sendmmsg, allocated by connect_to and reused by every batch.
+        # the streams send concurrently, so the lock keeps a batch from overwriting another that waits to be sent
+        self._send_iovecs = None
+        self._send_iovec_pointers = None
+        self._send_messages = None
+        self._send_control: bytearray | None = None
+        self._send_control_address = 0
+        self._send_lock = asyncio.Lock()
+        # the free packets of the connection (a LIFO stack), their buffers are slices of slabs of SEND_BATCH_SIZE packets
+        self._packet_pool: List[_QUICPacket] = []
+
+        # the receive buffers for recvmmsg, allocated by listen (the sender only reads ACK packets)
+        self._recv_pool: bytearray | None = None
+        self._recv_view: memoryview | None = None
+        self._recv_control: bytearray | None = None
+        self._recv_iovecs = None
+        self._recv_messages = None
+        # the received packets that were not handled yet (they are views into the receive pool)
+        self._received: Deque[memoryview] = deque()
+
+    def _set_buffer_size(self, option: int, force_option: int, limit_name: str) -> None:
+        """
+        This function will ask for a SOCKET_BUFFER_SIZE socket buffer, and warn if the kernel granted less.
+        With the privilege for it (root), the buffer is forced above the system limit.
+        :param option: SO_SNDBUF or SO_RCVBUF.
+        :param force_option: SO_SNDBUFFORCE or SO_RCVBUFFORCE.
+        :param limit_name: The name of the system limit of the buffer size (for the warning).
+        :return: None
+        """
+        forced = False
+        if sys.platform.startswith('linux'):
+            try:
+                self._socket.setsockopt(socket.SOL_SOCKET, force_option, SOCKET_BUFFER_SIZE)
+                forced = True
+            except OSError:
+                pass  # not privileged, the size is capped by the system limit
+        if not forced:
+            try:
+                self._socket.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFFER_SIZE)
+            except OSError:
+                pass
+        granted = self._socket.getsockopt(socket.SOL_SOCKET, option)
+        # Linux reports double the requested size (the extra half is for the bookkeeping overhead)
+        if sys.platform.startswith('linux'):
+            granted //= 2
+        if granted < SOCKET_BUFFER_SIZE:
+            print(f"Warning: the socket buffer is {granted} bytes instead of {SOCKET_BUFFER_SIZE}, "
+                  f"raise {limit_name} to get the full size")
+
+    def _allocate_send_buffers(self) -> None:
+        """
+        This function will allocate the message arrays for sendmmsg, once for the connection:
+        an iovec for each packet of a batch, a message for each GSO group of packets,
+        and a UDP_SEGMENT control message for each message (only the segment size changes between the batches).
+        :return: None
+        """
+        if self._send_messages is not None:
+            return
+        self._send_iovecs = (_IOVec * SEND_BATCH_SIZE)()
+        self._send_iovec_pointers = [ctypes.pointer(iovec) for iovec in self._send_iovecs]
+        self._send_messages = (_MMsgHdr * SEND_BATCH_SIZE)()
+        self._send_control = bytearray(SEND_BATCH_SIZE * _GSO_CONTROL_SIZE)
+        self._send_control_address = ctypes.addressof(ctypes.c_char.from_buffer(self._send_control))
+        for i in range(SEND_BATCH_SIZE):
+            _CMSG_HEADER.pack_into(self._send_control, i * _GSO_CONTROL_SIZE, _CMSG_HEADER.size + 2,
+                                   _SOL_UDP, _UDP_SEGMENT)
+
+    def _allocate_receive_buffers(self) -> None:
+        """
+        This function will allocate the receive buffers for recvmmsg, once for the connection:
+        one contiguous pool that is split to RECV_BATCH_SIZE buffers, with an iovec and a control buffer for each of them.
+        The socket is connected to the peer, so the source address of the packets is not needed.
+        :return: None
+        """
+        if self._recv_pool is not None:
+            return
+        self._recv_pool = bytearray(RECV_BATCH_SIZE * RECV_BUFFER_SIZE)
+        self._recv_view = memoryview(self._recv_pool)
+        self._recv_control = bytearray(RECV_BATCH_SIZE * _RECV_CONTROL_SIZE)
+        self._recv_iovecs = (_IOVec * RECV_BATCH_SIZE)()
+        self._recv_messages = (_MMsgHdr * RECV_BATCH_SIZE)()
+        pool_address = ctypes.addressof(ctypes.c_char.from_buffer(self._recv_pool))
+        control_address = ctypes.addressof(ctypes.c_char.from_buffer(self._recv_control))
+        for i in range(RECV_BATCH_SIZE):
+            self._recv_iovecs[i].iov_base = pool_address + i * RECV_BUFFER_SIZE
+            self._recv_iovecs[i].iov_len = RECV_BUFFER_SIZE
+            self._recv_messages[i].msg_hdr.msg_iov = ctypes.pointer(self._recv_iovecs[i])
+            self._recv_messages[i].msg_hdr.msg_iovlen = 1
+            self._recv_messages[i].msg_hdr.msg_control = control_address + i * _RECV_CONTROL_SIZE
+
+    async def listen(self, host: str, port: int):
         """
         This function will listen for incoming connection.
         :param host: The IP address to listen on.
@@ -49,9 +292,11 @@ class QUIC:
 
         # Bind the socket to the address
         self._socket.bind((self._host, self._port))
+        self._allocate_receive_buffers()
 
         # Wait for the client to send a SYN packet
-        data, addr = self._socket.recvfrom(_QUICPacket.MAX_PACKET_SIZE)
+        loop = asyncio.get_running_loop()
+        data, addr = await loop.sock_recvfrom(self._socket, _QUICPacket.MAX_PACKET_SIZE)
 
         print(f"Connection request from {addr}")
 
@@ -61,14 +306,25 @@ class QUIC:
         # check if the client sent a SYN packet
         if packet.flags == QUIQ_Flags.SYN:
             print(f"Received packet syn packet from {addr}")
+            # connect the socket to the sender, so the packets are sent without a destination address
+            # and received without a source address
+            self._socket.connect(addr)
+            self._is_connected = True
+            # let the kernel deliver a burst of segments from the sender as one super-packet (GRO)
+            if _libc_recvmmsg is not None:
+                try:
+                    self._socket.setsockopt(_SOL_UDP, _UDP_GRO, 1)
+                    self._gro = True
+                except OSError:
+                    self._gro = False
             # Send an ACCEPT_CONNECTION packet to the client
-            packet.flags = QUIQ_Flags.ACCEPT_CONNECTION
-            self._socket.sendto(packet.serialize(), addr)
+            packet = _QUICPacket(QUIQ_Flags.ACCEPT_CONNECTION)
+            await loop.sock_sendall(self._socket, packet.serialize())
         else:  # If the client did not send a SYN packet
             # we assume that everything is ok, if not, we will raise an exception and stop the program of the receiver
             raise ConnectionError("The client did not send a SYN packet")
 
-    def connect_to(self, host: str, port: int):
+    async def connect_to(self, host: str, port: int):
         """
         This function will connect to a receiver.
 
@@ -78,38 +334,82 @@ class QUIC:
         """
         self._host = host
         self._port = port
+        # connect the socket to the receiver, so the route is resolved once and not on every packet
+        self._socket.connect((self._host, self._port))
+        self._is_connected = True
+        self._allocate_send_buffers()
 
         # Send a SYN packet to the receiver so start the connection
+        loop = asyncio.get_running_loop()
         packet = _QUICPacket(QUIQ_Flags.SYN)
-        self._socket.sendto(packet.serialize(), (self._host, self._port))
+        await loop.sock_sendall(self._socket, packet.serialize())
 
         # Wait for the receiver to accept the connection
-        data, addr = self._socket.recvfrom(_QUICPacket.MAX_PACKET_SIZE)
+        data = await loop.sock_recv(self._socket, _QUICPacket.MAX_PACKET_SIZE)
         packet = _QUICPacket.deserialize(data)[0]
         if packet.flags == QUIQ_Flags.ACCEPT_CONNECTION:
-            print(f"Connection established with {addr}")
+            print(f"Connection established with {(self._host, self._port)}")
+            # check if the kernel supports UDP segmentation offload (GSO), the segment size is set on each send
+            if _libc_sendmmsg is not None:
+                try:
+                    self._socket.setsockopt(_SOL_UDP, _UDP_SEGMENT, 0)
+                    self._gso = True
+                except OSError:
+                    self._gso = False
         else:
             # If the receiver did not accept the connection, raise an exception
             raise ConnectionError("The receiver did not accept the connection")
 
-    async def send_files(self, data: List[bytes]) -> None:
+    async def send_files(self, data: List[bytes | memoryview | BinaryIO]) -> None:
         """
         This function will send a list of files (or part of some data in bytes format) to the receiver.
         The function will open a stream for each byte object in the list and send it to the receiver (asynchronously).
-        :param data: A list of bytes objects.
+        The frames are sliced from the objects without copying, so any bytes-like object can be sent
+        (for example a memoryview of a memory-mapped file).
+        A file opened in binary mode can be sent as well, it is read one frame at a time,
+        so the whole file is never in memory (each stream needs its own file object).
+        :param data: A list of bytes-like objects or binary files.
         :return: None
         """
+        # check the sizes before anything is sent, the frame offset field is 32 bit
+        for f in data:
+            size = _stream_size(f)
+            if size is not None and size > MAX_STREAM_SIZE:
+                raise ValueError(f"Stream size {size} exceeds the maximum of {MAX_STREAM_SIZE} bytes")
+
         for i, f in enumerate(data):
             self._output_streams[i + 1] = f
 
+        # read the ACK packets whenever they arrive, to move the window of packets in flight
+        self._in_flight = asyncio.Queue(max(1, self._window_size() // _QUICPacket.MAX_PACKET_SIZE))
+        ack_reader = asyncio.create_task(self._read_acks())
+
         # send the data on the streams
-        await self._streams_send()
+        try:
+            await self._streams_send()
+        finally:
+            # wait for the ACK reader to stop, so it no longer waits on the socket when the connection is closed
+            ack_reader.cancel()
+            try:
+                await ack_reader
+            except asyncio.CancelledError:
+                pass
         self._output_streams.clear()  # clear the output_streams dictionary
 
         # send the DATA_FIN packet to the receiver
         print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~Sending DATA_FIN packet~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
         packet = _QUICPacket(QUIQ_Flags.DATA_FIN)
-        self._socket.sendto(packet.serialize(), (self._host, self._port))
+        await asyncio.get_running_loop().sock_sendall(self._socket, packet.serialize())
+
+    async def send_file_as_n_streams(self, data: bytes | memoryview, n: int) -> None:
+        """
+        This function will send the same data to the receiver on n streams.
+        All the streams slice their frames from the same buffer, so the data is never copied per stream.
+        :param data: A bytes-like object to send on every stream.
+        :param n: The number of streams to open.
+        :return: None
+        """
+        await self.send_files([data] * n)
 
     async def _streams_send(self) -> None:
         """
@@ -132,124 +432,368 @@ class QUIC:
         # get the data from the output_streams dictionary
         data = self._output_streams[stream_id]
         # print(f"Sending data: {data}")
-        # get a random frame size between 1000 and 2000 (excluding the frame header size)
-        frame_size = int(random.uniform(1000, 2000))
-        frame_data_length = frame_size - _QUICPacket.FRAME_HEADER_SIZE  # calculate the frame data length
-        number_of_frames = len(data) // frame_data_length  # calculate the number of frames
-
-        # check if you need an extra frame
-        if len(data) % frame_data_length != 0:
-            number_of_frames += 1
-
-        # calculate the number of frames per packet
-        frame_per_packet = _QUICPacket.MAX_PAYLOAD_SIZE // frame_size
-        offset = 0
-
-        # calculate the number of packets
-        number_of_packets = number_of_frames // frame_per_packet
-        if number_of_frames % frame_per_packet != 0:
-            number_of_packets += 1
-
-        print(f"{stream_id=}, {number_of_packets=}, {frame_per_packet=}, {number_of_frames=}, {frame_size=}")
-
-        # create the packets and send
-        for i in range(number_of_packets):
-            if i == 0:
-                packet = _QUICPacket(QUIQ_Flags.STREAM_FIRST)
-            elif i == number_of_packets - 1:
-                packet = _QUICPacket(QUIQ_Flags.STREAM_LAST)
+        # each packet carries one frame that fills the packet, only the last frame can be shorter
+        frame_data_length = _FRAME_DATA_SIZE
+
+        print(f"{stream_id=}, {frame_data_length=}")
+
+        # bind the names used in the loop once, instead of looking them up for every packet
+        # (plain ints, the operators of the QUIQ_Flags members are implemented in Python)
+        first = int(QUIQ_Flags.DATA | QUIQ_Flags.STREAM_FIRST)
+        last = int(QUIQ_Flags.DATA | QUIQ_Flags.STREAM_LAST)
+        middle = int(QUIQ_Flags.DATA)
+        in_flight = self._in_flight
+        send_batch = self._send_batch
+        acquire_packet = self._acquire_packet
+        release_packets = self._packet_pool.extend
+
+        # the serialized packets that are waiting to be sent in the next batch, and the packets they belong to
+        # (the packets go back to the pool once the batch was sent)
+        batch = []
+        batch_packets: List[_QUICPacket] = []
+
+        # create the packets and send, the offset of each frame is its byte offset in the data
+        position = 0
+        for chunk, is_last in _stream_chunks(data, frame_data_length):
+            if position == 0:
+                # a stream of a single packet is both the first and the last packet
+                flags = first | last if is_last else first
+            elif is_last:
+                flags = last
             else:
-                packet = _QUICPacket(QUIQ_Flags.DATA)
-            # add the frames to the packet
-            for _ in range(frame_per_packet):
-                if offset == number_of_frames - 1:  # if this is the last frame, we will add the remaining data and end the loop
-                    data_to_send = data[offset * frame_data_length: len(data)]
-                    packet.add_frame(stream_id, offset, data_to_send)
-                    break
-                data_to_send = data[offset * frame_data_length: (offset + 1) * frame_data_length]
-                packet.add_frame(stream_id, offset, data_to_send)
-                offset += 1
+                flags = middle
+
+            # if the window is full, send the waiting packets before waiting for the window
+            if batch and in_flight.full():
+                await send_batch(batch)
+                release_packets(batch_packets)
+                batch, batch_packets = [], []
+
+            packet = acquire_packet(flags)
+            batch_packets.append(packet)
+            packet.add_frame(stream_id, position, chunk)
+            position += len(chunk)
+
+            # if the window is full, wait for the receiver to acknowledge the packets in flight
+            if in_flight.full():
+                await self._wait_for_window(packet.packet_number)
+            else:
+                in_flight.put_nowait(packet.packet_number)
 
-            self._socket.sendto(packet.serialize(), (self._host, self._port))
+            batch.append(packet.serialize())
+
+            # send the batch when it is full or when this is the last packet of the stream
+            if len(batch) == SEND_BATCH_SIZE or is_last:
+                await send_batch(batch)
+                release_packets(batch_packets)
+                batch, batch_packets = [], []
+                # let the other streams run
+                await asyncio.sleep(0)
+
+    def _window_size(self) -> int:
+        """
+        This function will calculate the maximum number of bytes in flight.
+        The receiver uses the same buffer size, so the window grows with the receive buffer that the kernel granted
+        (the kernel reports double the usable size, and charges each small datagram about twice its size).
+        :return: The size of the window in bytes.
+        """
+        receive_buffer = self._socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        return max(SEND_WINDOW_BYTES, receive_buffer // 4)
+
+    def _acquire_packet(self, flags: int) -> '_QUICPacket':
+        """
+        This function will take a free packet from the pool of the connection and reset it.
+        If the pool is empty, a new slab (one buffer for SEND_BATCH_SIZE packets) is allocated.
+        The packet should be returned to the pool (self._packet_pool) once it was sent.
+        :param flags: The flags of the packet.
+        :return: The packet.
+        """
+        pool = self._packet_pool
+        if not pool:
+            size = _QUICPacket.MAX_PACKET_SIZE
+            slab = memoryview(bytearray(SEND_BATCH_SIZE * size))
+            pool.extend(_QUICPacket(0, slab[i * size:(i + 1) * size]) for i in range(SEND_BATCH_SIZE))
+        packet = pool.pop()
+        packet.reset(flags)
+        return packet
+
+    async def _wait_for_window(self, packet_number: int) -> None:
+        """
+        This function will wait until there is a place for the packet in the window of packets in flight.
+        If no ACK packet arrives in time, the oldest packet in flight is assumed to be lost.
+        :param packet_number: The number of the packet that is about to be sent.
+        :return: None
+        """
+        try:
+            await asyncio.wait_for(self._in_flight.put(packet_number), ACK_TIMEOUT)
+        except asyncio.TimeoutError:
+            # an ACK packet could free the window while the put was cancelled
+            if self._in_flight.full():
+                self._in_flight.get_nowait()
+            self._in_flight.put_nowait(packet_number)
+
+    async def _read_acks(self) -> None:
+        """
+        This function will read the ACK packets from the socket while the streams are sent.
+        Each ACK packet carries the number of data packets that the receiver got so far,
+        so the packets that were acknowledged since the previous ACK are removed from the window.
+        Runs until it is cancelled.
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        ack_view = memoryview(bytearray(_HDR_SIZE))
+        while True:
+            try:
+                size = await loop.sock_recv_into(self._socket, ack_view)
+            except ConnectionRefusedError:
+                continue
+
+            if size == _HDR_SIZE:
+                flags, received_packets, _ = _HDR.unpack_from(ack_view)
+                newly_acked = (received_packets - self._acked_packets) & _PACKET_NUMBER_MASK
+                # ignore an old ACK packet that arrived after a newer one
+                if flags == QUIQ_Flags.ACK_DATA and newly_acked <= _PACKET_NUMBER_MASK // 2:
+                    self._acked_packets = received_packets
+                    for _ in range(min(newly_acked, self._in_flight.qsize())):
+                        self._in_flight.get_nowait()
+
+    async def _send_batch(self, packets: List[memoryview]) -> None:
+        """
+        This function will send a batch of serialized packets to the receiver.
+        On Linux the whole batch is handed to the kernel in a single `sendmmsg` call,
+        on other platforms the packets are sent one by one with `send`.
+        If GSO is enabled, consecutive packets of the same size are sent as one message that the kernel splits
+        to the original packets (UDP_SEGMENT).
+        :param packets: The serialized packets.
+        :return: None
+        """
+        # the streams send concurrently, only one of them can wait for the socket to be writable
+        async with self._send_lock:
+            if _libc_sendmmsg is None:
+                loop = asyncio.get_running_loop()
+                for packet in packets:
+                    await loop.sock_sendall(self._socket, packet)
+                return
+
+            while packets:
+                packets = await self._send_messages_batch(packets)
+
+    async def _send_messages_batch(self, packets: List[memoryview]) -> List[memoryview]:
+        """
+        This function will send a batch of serialized packets with sendmmsg, using the message arrays of the connection.
+        Must be called with the send lock held.
+        :param packets: The serialized packets (at most SEND_BATCH_SIZE).
+        :return: The packets that were not sent because GSO failed (they should be sent again without GSO).
+        """
+        groups = self._segment_groups(packets) if self._gso else [[packet] for packet in packets]
+
+        # fill the mmsghdr array, each message has an iovec for each of its packets,
+        # and a UDP_SEGMENT control message if it carries more than one packet.
+        # the socket is connected, so the messages have no destination address.
+        # the packets list keeps the buffers alive until the call returns.
+        count = len(groups)
+        iovecs = self._send_iovecs
+        iovec_pointers = self._send_iovec_pointers
+        messages = self._send_messages
+        control = self._send_control
+        iovec_index = 0
+        for i, group in enumerate(groups):
+            message = messages[i].msg_hdr
+            message.msg_iov = iovec_pointers[iovec_index]
+            message.msg_iovlen = len(group)
+            for packet in group:
+                iovecs[iovec_index].iov_base = ctypes.addressof(ctypes.c_char.from_buffer(packet))
+                iovecs[iovec_index].iov_len = len(packet)
+                iovec_index += 1
+            if len(group) > 1:
+                _GSO_SIZE.pack_into(control, i * _GSO_CONTROL_SIZE + _cmsg_align(_CMSG_HEADER.size), len(group[0]))
+                message.msg_control = self._send_control_address + i * _GSO_CONTROL_SIZE
+                message.msg_controllen = _GSO_CONTROL_SIZE
+            else:
+                message.msg_control = None
+                message.msg_controllen = 0
+
+        # sendmmsg may send only part of the batch, so send until all the packets are sent
+        sent = 0
+        while sent < count:
+            result = _libc_sendmmsg(self._socket.fileno(),
+                                    ctypes.byref(messages, sent * ctypes.sizeof(_MMsgHdr)),
+                                    count - sent, 0)
+            if result < 0:
+                err = ctypes.get_errno()
+                if err == errno.EINTR:
+                    continue
+                if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    # the send buffer of the socket is full
+                    await self._wait_for_socket(writable=True)
+                    continue
+                if self._gso and err in (errno.EINVAL, errno.EIO):
+                    # the path (or the NIC) can't segment the packets, send the rest of the batch without GSO
+                    self._gso = False
+                    return [packet for group in groups[sent:] for packet in group]
+                raise OSError(err, os.strerror(err))
+            sent += result
+        return []
+
+    async def _wait_for_socket(self, writable: bool = False) -> None:
+        """
+        This function will wait until the socket is readable (or writable).
+        :param writable: Wait for the socket to be writable instead of readable.
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
 
-            # wait 0.001 seconds to simulate the network delay and accept the ACK packet
-            await asyncio.sleep(0.001)
+        def on_ready():
+            if not ready.done():
+                ready.set_result(None)
+
+        if writable:
+            loop.add_writer(self._socket.fileno(), on_ready)
+        else:
+            loop.add_reader(self._socket.fileno(), on_ready)
+        try:
+            await ready
+        finally:
+            if writable:
+                loop.remove_writer(self._socket.fileno())
+            else:
+                loop.remove_reader(self._socket.fileno())
 
-    async def receive(self) -> List[bytes] | None:
+    @staticmethod
+    def _segment_groups(packets: List[memoryview]) -> List[List[memoryview]]:
+        """
+        This function will split the packets to groups that can be sent as one GSO message.
+        All the packets in a group have the same size, except the last one that may be shorter.
+        :param packets: The serialized packets.
+        :return: A list of groups of packets.
+        """
+        groups = []
+        group = []
+        group_bytes = 0
+        for packet in packets:
+            if group and (len(packet) > len(group[0])  # a segment can't be bigger than the first one
+                          or len(group[-1]) < len(group[0])  # only the last segment can be shorter
+                          or len(group) == _GSO_MAX_SEGMENTS
+                          or group_bytes + len(packet) > _GSO_MAX_BYTES):
+                groups.append(group)
+                group, group_bytes = [], 0
+            group.append(packet)
+            group_bytes += len(packet)
+        if group:
+            groups.append(group)
+        return groups
+
+    async def receive(self) -> List[bytearray] | None:
         """
         This function will receive a message from the socket.
         It sends an ACK packet to the sender.
         The data will be stored in the input_streams dictionary.
-        :return: List of bytes objects, or None if the connection is closed.
+        :return: List of bytearray objects, or None if the connection is closed.
         """
+        # bind the names used in the loop once, instead of looking them up for every packet
+        received = self._received
+        deserialize = _QUICPacket.deserialize
+        stream_index = self._stream_index
+        stream_time = self._stream_time
+        total = self.total_connection_statistics
+        add_statistics = self._add_statistics
+        # the statistics are summed over consecutive packets of the same stream (a run),
+        # and added to the statistics arrays once per run instead of once per packet
+        run_index = -1
+        run_packets = run_frames = run_bytes = run_payload = 0
+        input_streams = self._input_streams
+        frame_header_size = _QUICPacket.FRAME_HEADER_SIZE
+        # plain ints, the operators of the QUIQ_Flags members are implemented in Python (and return new members)
+        data_flag, data_or_ack, fin = int(QUIQ_Flags.DATA), int(QUIQ_Flags.DATA | QUIQ_Flags.ACK), int(QUIQ_Flags.FIN)
+        stream_first, stream_last = int(QUIQ_Flags.STREAM_FIRST), int(QUIQ_Flags.STREAM_LAST)
         while True:
-            # Wait for the sender to send a packet
-            data, addr = self._socket.recvfrom(_QUICPacket.MAX_PACKET_SIZE)
-            packet, frames = _QUICPacket.deserialize(data)
+            # Wait for the sender to send a batch of packets
+            if not received:
+                await self._receive_batch()
+            data = received.popleft()
+            packet, frames = deserialize(data)
+            flags = packet.flags
 
-            # if the packet is a data packet
-            if packet.flags in range(QUIQ_Flags.DATA, QUIQ_Flags.DATA_FIN + 1):
+            # if the packet is a data packet (and not an ACK of data)
+            if flags & data_or_ack == data_flag:
 
                 # NOTE: if we receive only one packet, we will not be able to calculate the time,
                 # but it is not a problem because we will not consider the time of one packet
                 # (it will be not accurate anyway)
 
-                # we start measuring the time of the first frame of each stream
-                if packet.flags == QUIQ_Flags.STREAM_FIRST:
-                    start_time = time.time()
-                    if frames[0].stream_id not in self.stream_statistics:  # need for continuous streams
-                        self.stream_statistics[frames[0].stream_id] = Stream_Statistics(frames[0].stream_id, 0, 0, 0, 0,
-                                                                                        0)
-                    self.stream_statistics[frames[0].stream_id].time = start_time
-                    self.total_connection_statistics.time = start_time
-
-                # count the number of frames in each stream
-                if len(frames) != 0:
-                    self.stream_statistics[frames[0].stream_id].number_of_frames += len(frames)
-                    self.total_connection_statistics.number_of_frames += len(frames)
-
-                # if the packet is the last frame of the stream
-                if packet.flags == QUIQ_Flags.STREAM_LAST:
-                    end_time = time.time()
-                    self.stream_statistics[frames[0].stream_id].time = (
-                            end_time - self.stream_statistics[frames[0].stream_id].time
-                    )
+                # all the frames of a packet belong to the same stream
+                sid = frames[0][0] if frames else None
 
-                if packet.flags == QUIQ_Flags.DATA_FIN:
+                if flags & fin:
+                    if run_packets:
+                        add_statistics(run_index, run_packets, run_frames, run_bytes, run_payload)
                     # calculate the time it took to send all the data on all the streams
                     end_time = time.time()
-                    self.total_connection_statistics.time = end_time - self.total_connection_statistics.time
+                    total.time = end_time - total.time
                     print("Received all the data")
                     self.display_statistics()
                     break
 
-                # update the statistics
+                # the stream is added by the first of its packets that arrives, which is not always the STREAM_FIRST one
+                index = stream_index.get(sid)
+                if index is None:
+                    self._add_stream_statistics(sid)
+                    index = stream_index[sid]
+                number_of_frames = len(frames)
+
+                # we start measuring the time of the first frame of each stream
+                if flags & stream_first:
+                    start_time = time.time()
+                    stream_time[index] = start_time
+                    total.time = start_time
+
+                # if the packet is the last frame of the stream
+                if flags & stream_last:
+                    stream_time[index] = time.time() - stream_time[index]
+
+                # update the statistics of the run, a packet of another stream starts a new run
+                if index != run_index:
+                    if run_packets:
+                        add_statistics(run_index, run_packets, run_frames, run_bytes, run_payload)
+                    run_index = index
+                    run_packets = run_frames = run_bytes = run_payload = 0
+                run_packets += 1
+                run_frames += number_of_frames
+                run_bytes += len(data)
                 # sum the data length of the frames
-                payload_size = packet.payload_length - len(frames) * _QUICPacket.FRAME_HEADER_SIZE
-                # of the current stream
-                self.stream_statistics[frames[0].stream_id].number_of_packets += 1
-                self.stream_statistics[frames[0].stream_id].total_bytes += len(data)
-                self.stream_statistics[frames[0].stream_id].payload_size += payload_size
-
-                # of the total connection
-                self.total_connection_statistics.number_of_packets += 1
-                self.total_connection_statistics.total_bytes += len(data)
-                self.total_connection_statistics.payload_size += payload_size
-
-                for frame in frames:
-                    # IMPORTANT!
-                    # we assume that the frames are in order, and all the frames are received
-                    # if data loss was an option, each frame offset would be considered.
-                    if frame.stream_id in self._input_streams:
-                        self._input_streams[frame.stream_id] += frame.data
+                run_payload += packet.payload_length - number_of_frames * frame_header_size
+
+                # the frame data is a view of the receive pool, so it is copied here,
+                # straight to its offset in the buffer of the stream
+                buffer = input_streams.get(sid)
+                if buffer is None:
+                    buffer = input_streams[sid] = bytearray()
+                for _, offset, frame_data in frames:
+                    if offset == len(buffer):  # the frames are usually in order
+                        buffer += frame_data
                     else:
-                        self._input_streams[frame.stream_id] = frame.data
-
-                # send an ACK packet to the sender
-                self._socket.sendto(_QUICPacket(QUIQ_Flags.ACK_DATA).serialize(), addr)
+                        if offset > len(buffer):  # fill the gap until the missing frames arrive
+                            buffer.extend(bytes(offset - len(buffer)))
+                        buffer[offset:offset + len(frame_data)] = frame_data
+
+                self._received_packets += 1
+
+                # send one ACK packet to the sender for the whole batch,
+                # it carries the number of data packets received so far in the packet number field
+                if not received:
+                    add_statistics(run_index, run_packets, run_frames, run_bytes, run_payload)
+                    run_packets = run_frames = run_bytes = run_payload = 0
+                    _PACKET_NUMBER.pack_into(self._ack_packet, _PACKET_NUMBER_OFFSET,
+                                             self._received_packets & _PACKET_NUMBER_MASK)
+                    try:
+                        await asyncio.get_running_loop().sock_sendall(self._socket, self._ack_packet)
+                    except ConnectionRefusedError:
+                        # the sender already closed its socket, the ACKs are cumulative so the next one covers it
+                        pass
 
             # if the packet is a close connection packet
-            if packet.flags == QUIQ_Flags.FIN:
+            if flags == fin:
                 # close the connection
                 self._socket.close()
                 self._is_closed = True
@@ -259,13 +803,75 @@ class QUIC:
         # return the files that were received in each stream
         return self._build_files()
 
-    def _build_files(self) -> List[bytes]:
+    async def _receive_batch(self) -> None:
+        """
+        This function will wait for packets from the socket and store them in the received queue.
+        On Linux up to RECV_BATCH_SIZE packets are received in a single `recvmmsg` call,
+        on other platforms a single packet is received with `recv`.
+        If GRO is enabled, a received super-packet is split back to the packets by the segment size
+        that the kernel reports in the control message.
+        The received packets are views into the receive pool, so they are valid until the next call.
+        :return: None
+        """
+        if _libc_recvmmsg is None:
+            loop = asyncio.get_running_loop()
+            while True:
+                try:
+                    size = await loop.sock_recv_into(self._socket, self._recv_view[:RECV_BUFFER_SIZE])
+                    break
+                except ConnectionRefusedError:
+                    # an ACK packet was rejected by the peer (the socket is connected, so the error is reported)
+                    continue
+            self._received.append(self._recv_view[:size])
+            return
+
+        for i in range(RECV_BATCH_SIZE):
+            self._recv_messages[i].msg_hdr.msg_controllen = _RECV_CONTROL_SIZE if self._gro else 0
+
+        # take all the packets that are already queued, if there are none wait until the socket is readable
+        while True:
+            count = _libc_recvmmsg(self._socket.fileno(), self._recv_messages, RECV_BATCH_SIZE, _MSG_DONTWAIT, None)
+            if count >= 0:
+                break
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK):
+                await self._wait_for_socket()
+            elif err not in (errno.EINTR, errno.ECONNREFUSED):
+                # ECONNREFUSED - an ACK packet was rejected by the peer (reported because the socket is connected)
+                raise OSError(err, os.strerror(err))
+
+        for i in range(count):
+            start = i * RECV_BUFFER_SIZE
+            end = start + self._recv_messages[i].msg_len
+            segment_size = self._gro_segment_size(i) or (end - start)
+            for offset in range(start, end, segment_size):
+                self._received.append(self._recv_view[offset:min(offset + segment_size, end)])
+
+    def _gro_segment_size(self, index: int) -> int:
+        """
+        This function will find the GRO segment size in the control messages of a received message.
+        :param index: The index of the message in the last recvmmsg batch.
+        :return: The segment size, or 0 if the message is a single packet.
+        """
+        start = index * _RECV_CONTROL_SIZE
+        end = start + self._recv_messages[index].msg_hdr.msg_controllen
+        offset = start
+        while offset + _CMSG_HEADER.size <= end:
+            length, level, cmsg_type = _CMSG_HEADER.unpack_from(self._recv_control, offset)
+            if length < _CMSG_HEADER.size:
+                break
+            if level == _SOL_UDP and cmsg_type == _UDP_GRO:
+                return _GRO_SIZE.unpack_from(self._recv_control, offset + _cmsg_align(_CMSG_HEADER.size))[0]
+            offset += _cmsg_align(length)
+        return 0
+
+    def _build_files(self) -> List[bytearray]:
         """
         This function will build the files from the input_streams dictionary.
         Will clear the input_streams dictionary.
-        :return: A list of bytes objects.
+        :return: A list of bytearray objects.
         """
-        # get the files from the input_streams dictionary
+        # the data of each stream is already assembled in its buffer
         files = list(self._input_streams.values())
         # clear the input_streams dictionary
         self._input_streams.clear()
@@ -282,7 +888,14 @@ class QUIC:
 
         # send a FIN packet to the peer
         packet = _QUICPacket(QUIQ_Flags.FIN)
-        self._socket.sendto(packet.serialize(), (self._host, self._port))
+        if self._is_connected:
+            try:
+                self._socket.send(packet.serialize())
+            except ConnectionRefusedError:
+                # the peer already closed its socket
+                pass
+        else:
+            self._socket.sendto(packet.serialize(), (self._host, self._port))
 
         # IMPORTANT!
         # we assume that the peer gets the FIN packet and closes the connection
@@ -292,6 +905,49 @@ class QUIC:
         self._is_closed = True
         print("Connection closed")
 
+    def _add_stream_statistics(self, stream_id: int) -> None:
+        """
+        Add a stream to the statistics arrays.
+        :param stream_id: The id of the stream.
+        :return: None
+        """
+        self._stream_index[stream_id] = len(self._stream_index)
+        for counters in (self._stream_packets, self._stream_frames, self._stream_bytes, self._stream_payload,
+                         self._stream_time):
+            counters.append(0)
+
+    def _add_statistics(self, index: int, packets: int, frames: int, total_bytes: int, payload_size: int) -> None:
+        """
+        Add the counters of some packets of a stream to the statistics of the stream and of the connection.
+        :param index: The index of the stream in the statistics arrays.
+        :param packets: The number of packets.
+        :param frames: The number of frames in the packets.
+        :param total_bytes: The size of the packets.
+        :param payload_size: The size of the data in the frames.
+        :return: None
+        """
+        self._stream_packets[index] += packets
+        self._stream_frames[index] += frames
+        self._stream_bytes[index] += total_bytes
+        self._stream_payload[index] += payload_size
+
+        total = self.total_connection_statistics
+        total.number_of_packets += packets
+        total.number_of_frames += frames
+        total.total_bytes += total_bytes
+        total.payload_size += payload_size
+
+    @property
+    def stream_statistics(self) -> Dict[int, 'Stream_Statistics']:
+        """
+        The statistics of each stream, built from the statistics arrays.
+        """
+        return {
+            stream_id: Stream_Statistics(stream_id, self._stream_packets[i], self._stream_frames[i],
+                                         self._stream_bytes[i], self._stream_payload[i], self._stream_time[i])
+            for stream_id, i in self._stream_index.items()
+        }
+
     def display_statistics(self) -> None:
         """
         Display the statistics of the connection as requested in the assignment.
@@ -307,11 +963,11 @@ class QUIC:
         print(f"\t{'Total time':<25}: {self.total_connection_statistics.time:,} seconds")
 
         # d part
-        avg_data_rate = self.total_connection_statistics.total_bytes / self.total_connection_statistics.time
+        avg_data_rate = _rate(self.total_connection_statistics.total_bytes, self.total_connection_statistics.time)
         print(f"\t{'Average data rate':<25}: {avg_data_rate:,} bytes per second")
 
         # e part
-        avg_packet_rate = self.total_connection_statistics.number_of_packets / self.total_connection_statistics.time
+        avg_packet_rate = _rate(self.total_connection_statistics.number_of_packets, self.total_connection_statistics.time)
         print(f"\t{'Average packet rate':<25}: {avg_packet_rate:,} packets per second")
 
         print("\nEach stream statistics:")
@@ -324,7 +980,7 @@ class QUIC:
             print(f"\t\t{'Time':<20}: {stream_stat.time:,} seconds")
 
             # c part
-            avg_data_rate = stream_stat.total_bytes / stream_stat.time
+            avg_data_rate = _rate(stream_stat.total_bytes, stream_stat.time)
             print(f"\t\t{'Average data rate':<20}: {avg_data_rate:,} bytes per second")
 
         print("\n~~~~~~~~~~~~~~~~~~~~~~~~~End of statistics~~~~~~~~~~~~~~~~~~~~~~~~~~")
@@ -337,100 +993,182 @@ class _QUICPacket:
     It uses fix size for the header and the frame header.
     """
 
-    # a constant for the maximum packet size
-    MAX_PACKET_SIZE = 15000
+    # a constant for the maximum packet size, small enough to fit in a typical path MTU without IP fragmentation
+    MAX_PACKET_SIZE = 1350
 
     # the format of the header
-    HEADER_FORMAT = '!BIQ'  # 1 byte for flags, 4 bytes for packet number, 8 bytes for payload length
-    HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+    HEADER_FORMAT = _HDR.format  # 1 byte for flags, 4 bytes for packet number, 8 bytes for payload length
+    HEADER_SIZE = _HDR_SIZE
     MAX_PAYLOAD_SIZE = MAX_PACKET_SIZE - HEADER_SIZE
 
     # the format of the frame
-    FRAME_FORMAT = '!IIQ'  # 4 bytes for stream_id, 4 bytes for offset, 8 bytes for data length
-    FRAME_HEADER_SIZE = struct.calcsize(FRAME_FORMAT)
+    FRAME_FORMAT = _FRM.format  # 4 bytes for stream_id, 4 bytes for offset, 8 bytes for data length
+    FRAME_HEADER_SIZE = _FRM_SIZE
 
-    # class variable to generate the packet number
-    _packet_number_gen = 0
+    def __init__(self, flags: int = 0, buffer: bytearray | memoryview | None = None):
+        self.flags = flags
+        self.packet_number = _next_packet_number()
+        self.payload_length = 0
+        # the packet is built in place: the header is packed at the start of the buffer and the frames after it
+        self._buf = bytearray(self.MAX_PACKET_SIZE) if buffer is None else buffer
+        self._end = _HDR_SIZE  # the end of the packet in the buffer
 
-    def __init__(self, flags: int = 0):
+    def reset(self, flags: int) -> None:
+        """
+        Reuse the packet (and its buffer) for a new packet.
+        The previous serialized packet is overwritten, so it must be sent before.
+        :param flags: The flags of the new packet.
+        :return: None
+        """
         self.flags = flags
-        self.packet_number = self.generate_packet_number()
+        self.packet_number = _next_packet_number()
         self.payload_length = 0
-        self.payload = bytearray()
+        self._end = _HDR_SIZE
 
-    @classmethod
-    def generate_packet_number(cls):
-        cls._packet_number_gen += 1
-        return cls._packet_number_gen
+    @property
+    def payload(self) -> memoryview:
+        """
+        The payload of the packet (a view of the packet buffer).
+        """
+        return memoryview(self._buf)[_HDR_SIZE:self._end]
 
     def add_frame(self, stream_id: int, offset: int, data: bytes):
         """
         try to add a frame to the packet payload
         if the frame can't fit in the payload, raise an exception
         """
-        # frame header + frame data.
-        # (!IIQ - 4 bytes for stream_id, 4 bytes for offset, 8 bytes for data length)
-        frame = struct.pack('!IIQ', stream_id, offset, len(data)) + data
-        if len(self.payload) + len(frame) <= self.MAX_PAYLOAD_SIZE:
+        # frame header + frame data, packed directly into the packet buffer
+        end = self._end + _FRM_SIZE + len(data)
+        if end - _HDR_SIZE <= self.MAX_PAYLOAD_SIZE:
             # if we can fit the frame in the payload, add it
-            self.payload_length += len(frame)
-            self.payload.extend(frame)
+            _FRM.pack_into(self._buf, self._end, stream_id, offset, len(data))
+            self._buf[self._end + _FRM_SIZE:end] = data
+            self.payload_length += end - self._end
+            self._end = end
         else:
             raise ValueError("Payload size exceeded")
 
-    def serialize(self) -> bytes:
+    def serialize(self) -> memoryview:
         """
         Serialize the packet to bytes.
-        :return: The packet as bytes.
+        The header is packed in front of the frames, so the packet is not copied.
+        :return: The packet as a view of the packet buffer (valid until the packet is changed).
         """
-        header = struct.pack(self.HEADER_FORMAT, self.flags, self.packet_number, len(self.payload))
-        return header + self.payload
+        _HDR.pack_into(self._buf, 0, self.flags, self.packet_number, self._end - _HDR_SIZE)
+        return memoryview(self._buf)[:self._end]
 
     @classmethod
-    def deserialize(cls, data: bytes) -> Tuple['_QUICPacket', List['_QUICFrame']]:
+    def deserialize(cls, data: bytes | memoryview) -> Tuple['_QUICPacket', List['_QUICFrame']]:
         """
         Deserialize the bytes to a packet and frames.
+        The packet payload and the frames data are views of the given data (nothing is copied),
+        so they are valid only as long as the data is not changed.
         :param data: The bytes to deserialize.
         :return: A tuple of the packet and a list of frames.
         """
-        header = struct.unpack(cls.HEADER_FORMAT, data[:cls.HEADER_SIZE])
-        flags, packet_number, payload_length = header
+        view = memoryview(data)
+        flags, packet_number, payload_length = _HDR.unpack_from(view)
 
-        packet = cls(flags)
+        end = min(_HDR_SIZE + payload_length, len(view))
+        packet = cls(flags, view[:end])
         packet.packet_number = packet_number
-        packet.payload = bytearray(data[cls.HEADER_SIZE:cls.HEADER_SIZE + payload_length])
         packet.payload_length = payload_length
+        packet._end = end
 
-        # parse the payload to frames
-        frames = []
-        offset = 0  # offset in the payload (not of the frame)
-        while offset < len(packet.payload):
-            stream_id, frame_offset, data_length = struct.unpack_from('!IIQ', packet.payload, offset)
-            offset += cls.FRAME_HEADER_SIZE  # the header size
-            frame_data = packet.payload[offset:offset + data_length]
-            frame = _QUICFrame(stream_id, frame_offset, data_length, frame_data)
-            frames.append(frame)
-            offset += data_length
-
-        return packet, frames
+        return packet, _parse_frames(view, _HDR_SIZE, end)
 
     def __str__(self):
         return f"_QUICPacket(flags={self.flags}, number={self.packet_number}, payload_size={len(self.payload)})"
 
 
-@dataclass
-class _QUICFrame:
+# the data size of a frame that fills a whole packet, the sender puts one frame in each packet
+_FRAME_DATA_SIZE = _QUICPacket.MAX_PAYLOAD_SIZE - _QUICPacket.FRAME_HEADER_SIZE
+
+
+def _stream_size(data: bytes | memoryview | BinaryIO) -> int | None:
+    """
+    Get the number of bytes that a stream will send.
+    :param data: A bytes-like object or a binary file.
+    :return: The size of the data, or None if it is not known before reading (a file that is not a regular file).
+    """
+    if not hasattr(data, 'readinto'):
+        return memoryview(data).nbytes
+    try:
+        return os.fstat(data.fileno()).st_size - data.tell()
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _stream_chunks(data: bytes | memoryview | BinaryIO, chunk_size: int) -> Iterator[Tuple[memoryview, bool]]:
+    """
+    Split the data of a stream to chunks of chunk_size bytes (only the last chunk can be shorter).
+    A bytes-like object is sliced without copying.
+    A file is read into two reused buffers, one chunk ahead, to know which chunk is the last.
+    A chunk is valid until the next chunk is taken.
+    :param data: A bytes-like object or a binary file.
+    :param chunk_size: The size of the chunks.
+    :return: An iterator of (chunk, is_last).
+    """
+    if hasattr(data, 'readinto'):
+        buffers = (memoryview(bytearray(chunk_size)), memoryview(bytearray(chunk_size)))
+        current = 0
+        size = data.readinto(buffers[current]) or 0
+        while size:
+            next_size = data.readinto(buffers[1 - current]) or 0
+            yield buffers[current][:size], not next_size
+            current = 1 - current
+            size = next_size
+    else:
+        view = memoryview(data)
+        length = len(view)
+        for start in range(0, length, chunk_size):
+            yield view[start:start + chunk_size], start + chunk_size >= length
+
+
+def _rate(amount: int, seconds: float) -> float:
+    """
+    Calculate a rate per second for the statistics.
+    The time of a stream of a single packet can be 0 (it is shorter than the resolution of the clock).
+    :param amount: The number of bytes or packets.
+    :param seconds: The time it took.
+    :return: The amount per second, or 0 if the time is too short to be measured.
+    """
+    return amount / seconds if seconds > 0 else 0.0
+
+
+def _parse_frames(view: memoryview, offset: int, end: int) -> List['_QUICFrame']:
+    """
+    Parse the frames of a packet payload.
+    This is the inner loop of the receive path, so it only uses local names.
+    :param view: The packet buffer.
+    :param offset: The offset of the first frame in the buffer.
+    :param end: The end of the payload in the buffer.
+    :return: A list of frames, the data of each frame is a view of the buffer.
+    """
+    frames = []
+    append = frames.append
+    unpack_from = _FRM.unpack_from
+    frame = _QUICFrame
+    header_size = _FRM_SIZE
+    while offset < end:
+        stream_id, frame_offset, data_length = unpack_from(view, offset)
+        offset += header_size
+        append(frame(stream_id, frame_offset, view[offset:offset + data_length]))
+        offset += data_length
+    return frames
+
+
+class _QUICFrame(NamedTuple):
     """
     This class represents a QUIC frame.
     This class contains the stream_id, offset, and data of the frame.
+    The data of a received frame is a view of the received packet.
+    A tuple is much cheaper to create than a dataclass, and a frame is created for every received frame.
+    The length of the data is len(data), it is not stored twice.
     """
     stream_id: int
     offset: int
-    data_length: int
-    data: bytes
-
-    def __len__(self):
-        return len(self.data)
+    data: bytes | memoryview
 
 
 @dataclass
@@ -446,16 +1184,17 @@ class Stream_Statistics:
     time: float
 
 
-class QUIQ_Flags(IntEnum):
+class QUIQ_Flags(IntFlag):
     """
-    Enum for the flags of the QUIC packet.
-    The range of ACK_DATA to DATA_FIN represents a data packet with different flags.
+    The flags of the QUIC packet, each flag is a bit, so a packet can have several flags.
+    A data packet has the DATA bit, the first and the last packets of a stream also have STREAM_FIRST / STREAM_LAST.
     """
     SYN = 1
-    ACCEPT_CONNECTION = 2  # SYN-ACK
-    ACK_DATA = 3
+    ACK = 2
     DATA = 4
-    STREAM_FIRST = 5  # for the statistics
-    STREAM_LAST = 6  # for the statistics
-    DATA_FIN = 7
     FIN = 8
+    STREAM_FIRST = 16  # for the statistics
+    STREAM_LAST = 32  # for the statistics
+    ACCEPT_CONNECTION = SYN | ACK  # SYN-ACK
+    ACK_DATA = ACK | DATA
+    DATA_FIN = DATA | FIN
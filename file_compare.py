@@ -1,19 +1,25 @@
-import difflib
+import filecmp
+from itertools import zip_longest
 
 FILE1 = "inputs/1mb_file.txt"
 NUM_OF_FILES = 3
 
-with open(FILE1, 'r') as f1:
-    for i in range(1,NUM_OF_FILES+1):
-        with open(f"file_{i}.txt", 'r') as f2:
-            diff = difflib.unified_diff(
-                f1.readlines(),
-                f2.readlines(),
-                fromfile=FILE1,
-                tofile=f"file_{i}.txt",
-            )
 
-            if list(diff):
-                print(f"file_{i}.txt is different from {FILE1}")
+def first_difference(file1: str, file2: str) -> int:
+    """
+    Find the first line that is different between two files, reading the files line by line.
+    :param file1: The path of the first file.
+    :param file2: The path of the second file.
+    :return: The number of the first different line (starting from 1), or 0 if the files are equal.
+    """
+    with open(file1, 'rb') as f1, open(file2, 'rb') as f2:
+        for line_number, (line1, line2) in enumerate(zip_longest(f1, f2), start=1):
+            if line1 != line2:
+                return line_number
+    return 0
 
 
+for i in range(1, NUM_OF_FILES + 1):
+    # compare the content byte by byte, stops at the first block that differs
+    if not filecmp.cmp(FILE1, f"file_{i}.txt", shallow=False):
+        print(f"file_{i}.txt is different from {FILE1} (first at line {first_difference(FILE1, f'file_{i}.txt')})")
@@ -6,7 +6,7 @@ PORT = 4269
 
 async def receiver() -> None:
     conn = QUIC()
-    conn.listen(HOST, PORT)
+    await conn.listen(HOST, PORT)
 
     # Keep receiving file data until the connection is closed
     while (file_data := await conn.receive()) is not None:
@@ -1,4 +1,6 @@
 import asyncio
+import mmap
+import os
 
 from QUIC_api import *
 
@@ -9,17 +11,31 @@ NUM_OF_FILES = 1
 FILE_NAME = "inputs/1mb_file.txt"
 
 
-async def sender(file_name: str, num_of_files: int):
-    with open(FILE_NAME, "rb") as f:
-        file_data = f.read()
+async def send_data(data: bytes | memoryview, num_of_files: int):
+    conn = QUIC()
+
+    await conn.connect_to(HOST, PORT)
+    await conn.send_file_as_n_streams(data, num_of_files)
+    conn.close()
 
-        conn = QUIC()
 
-        conn.connect_to(HOST, PORT)
-        await conn.send_files([file_data] * NUM_OF_FILES)
-        # sleep for two seconds
-        await asyncio.sleep(0.001)
-        conn.close()
+async def sender(file_name: str, num_of_files: int):
+    with open(file_name, "rb") as f:
+        # an empty file can't be mapped
+        if os.fstat(f.fileno()).st_size == 0:
+            await send_data(b'', num_of_files)
+            return
+
+        # map the file to memory instead of reading it, all the streams share the same pages
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            await send_data(memoryview(mm), num_of_files)
+        finally:
+            try:
+                mm.close()
+            except BufferError:
+                # views of the file are still referenced (by the traceback of an error), don't hide the error
+                pass
 
 
 if __name__ == '__main__':
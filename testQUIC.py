@@ -1,8 +1,7 @@
 from QUIC_api import *
-import threading
 import asyncio
+import contextlib
 import io
-import sys
 
 HOST = '127.0.0.1'
 PORT = 4269
@@ -16,7 +15,7 @@ async def start_receiver():
     :return: success message if all files are received successfully, error message otherwise
     """
     conn = QUIC()
-    conn.listen(HOST, PORT)
+    await conn.listen(HOST, PORT)
     file_data = []
     while True:
         new_file_data = await conn.receive()
@@ -47,58 +46,24 @@ async def start_sender():
     with open(FILE_TO_SEND, "rb") as f:
         file_data = f.read()
         conn = QUIC()
-        conn.connect_to(HOST, PORT)
-        await conn.send_files([file_data] * NUMBER_OF_STREAMS)
+        await conn.connect_to(HOST, PORT)
+        await conn.send_file_as_n_streams(file_data, NUMBER_OF_STREAMS)
         conn.close()
 
 
-def run_async_function(func):
+async def run_test():
     """
-    This function is used to run an async function in a synchronous way
-    will change the stdout and stderr to io.StringIO() to avoid printing the output of the async function
-    :param func: the async function to run
-    :return:
+    This function is used to run the receiver and the sender as two tasks on the same event loop
+    :return: the result of the receiver
     """
-
-    # save the old stdout and stderr
-    old_stdout = sys.stdout
-    old_stderr = sys.stderr
-
-    # change the stdout and stderr to io.StringIO()
-    sys.stdout = io.StringIO()
-    sys.stderr = io.StringIO()
-
-    try:  # run the async function
-        asyncio.set_event_loop(asyncio.new_event_loop())
-        loop = asyncio.get_event_loop()
-        result = loop.run_until_complete(func())
-        loop.close()
-        return result
-    finally:  # restore the old stdout and stderr
-        sys.stdout = old_stdout
-        sys.stderr = old_stderr
+    receiver_result, _ = await asyncio.gather(start_receiver(), start_sender())
+    return receiver_result
 
 
 def main():
-    receiver_result = None
-
-    def run_receiver():
-        nonlocal receiver_result
-        receiver_result = run_async_function(start_receiver)
-
-    def run_sender():
-        run_async_function(start_sender)
-
-    # run the receiver and sender in two different threads
-    receiver_thread = threading.Thread(target=run_receiver)
-    sender_thread = threading.Thread(target=run_sender)
-
-    receiver_thread.start()
-    sender_thread.start()
-
-    # wait for the two threads to finish
-    receiver_thread.join()
-    sender_thread.join()
+    # run the test with stdout and stderr redirected to io.StringIO(), to avoid printing the output of the connections
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        receiver_result = asyncio.run(run_test())
 
     # print the results
     print(receiver_result)
@@ -1,5 +1,4 @@
 import os
-import random
 
 def create_file(size: int, file_name: str):
     if os.path.isfile(file_name):
@@ -7,6 +6,6 @@ def create_file(size: int, file_name: str):
             return
     with open(file_name, 'wb') as f:
         # for i in range(size * 1024 * 1024):
-        f.write(random.randbytes(size * 1024 * 1024))
+        f.write(os.urandom(size * 1024 * 1024))
     #     f.write(b'/0' * size * 1024 * 1024)
 